@@ -4,54 +4,35 @@
 """
 import logging
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from io import UnsupportedOperation
-from json import dumps
-from os import fsync
 from sys import stdout
 
-from yaml import load, Loader
+from yaml import load
 
-from tinydb import JSONStorage, TinyDB, where
+from tinydb import TinyDB, where
+from tinydb.middlewares import CachingMiddleware
 
+from twitter2reddit.database import PrettyJSONStorage
 
-class PrettyJSONStorage(JSONStorage):
-    """Store the TinyDB with pretty json
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
 
-    Should be passed into a TinyDB constructor as the `storage` argument
-    """
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    def write(self, data: object):
-        """Write data to database in a pretty json format
-
-        Indents by 4 spaces and sorts keys
-
-        :param data: data to be saved in json format, needs to be json serializeable
-        :type data: object
-        :return: none
-        :rtype: None
-        """
-        self._handle.seek(0)
-        serialized = dumps(data, indent=4, sort_keys=True, **self.kwargs)
-        try:
-            self._handle.write(serialized)
-        except UnsupportedOperation as e:
-            raise IOError(
-                f'Cannot write to the database. Access mode is "{self._mode}"'
-            ) from e
-
-        self._handle.flush()
-        fsync(self._handle.fileno())
-
-        self._handle.truncate()
+logger = logging.getLogger(__name__)
 
 
 def main():
     """Convert old style (v1.0.0) database to new style (v2.0.0)"""
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("--log", dest="logfile", help="Log file.", metavar="LOGFILE")
+    parser.add_argument(
+        "--mode",
+        dest="mode",
+        help="level to log at",
+        metavar="MODE",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+    )
     parser.add_argument(
         "settings", help="env file that has info in it", metavar="yaml"
     )
@@ -66,47 +47,55 @@ def main():
     logging.basicConfig(
         format="%(asctime)s\t[%(levelname)s]\t{%(module)s}\t%(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
-        level=logging.DEBUG,
+        level=args.mode,
         handlers=handler_list,
     )
 
-    with open(args.settings, "r") as fp:
-        config = load(fp, Loader=Loader)
+    with open(args.settings, "rb") as fp:
+        config = load(fp.read(), Loader=Loader)
 
-    database = TinyDB(config.get("database"), storage=PrettyJSONStorage)
-    table = database.table(config.get("table"))
+    database = TinyDB(
+        config.get("database"),
+        storage=CachingMiddleware(PrettyJSONStorage),
+        durable=False,
+    )
+    table_name = config.get("table")
+    all_aid = config.get("all_aid")
+    all_hash = config.get("all_hash")
+    user = config.get("user")
+    table = database.table(table_name)
     meta = database.table("meta")
-    if not meta.search(where("table") == config.get("table")):
-        logging.info("Getting meta info")
-        number = table.search(where("number_counter").exists())[0]["number"]
+    documents = table.all()
+    counters = [document for document in documents if "number_counter" in document]
+    comics = [document for document in documents if "sid" in document]
+    if not any(document.get("table") == table_name for document in meta.all()):
+        logger.info("Getting meta info")
+        number = counters[0]["number"]
         meta_document = {
             "imgur": {
-                "album_id": config.get("all_aid"),
-                "deletehash": config.get("all_hash"),
+                "album_id": all_aid,
+                "deletehash": all_hash,
                 "title": config.get("all_name"),
                 "description": config.get("all_desc"),
             },
             "number": number,
             "reddit": {"subreddit": config.get("subreddit")},
-            "table": config.get("table"),
+            "table": table_name,
             "twitter": {
-                "user_name": config.get("user"),
-                "user_url": f"https://twitter.com/{config.get('user')}",
+                "user_name": user,
+                "user_url": f"https://twitter.com/{user}",
             },
         }
-        logging.info("Adding meta info")
-        meta.upsert(meta_document, where("table") == config.get("table"))
-        try:
-            counter = table.search(where("number_counter").exists())[0]
-            logging.info(
-                "Removing number counter from main table, current value is %s", counter
-            )
-            table.remove(doc_ids=[counter.doc_id])
-        except IndexError:
-            pass
-    comics = table.search(where("sid").exists())
+        logger.info("Adding meta info")
+        meta.upsert(meta_document, where("table") == table_name)
+        counter = counters[0]
+        logger.info(
+            "Removing number counter from main table, current value is %s", counter
+        )
+        table.remove(doc_ids=[counter.doc_id])
+    new_documents = []
     for comic in comics:
-        logging.info(
+        logger.debug(
             'Generating new document for doc_id "%d" with sid "%d"',
             comic.doc_id,
             comic["sid"],
@@ -122,16 +111,11 @@ def main():
                 "album_id": comic["aid"]
                 if comic["aid"] is not None
                 else (
-                    config.get("all_aid")
-                    if (
-                        comic["album"] is None
-                        or config.get("all_hash") == comic["album"]
-                    )
+                    all_aid
+                    if (comic["album"] is None or all_hash == comic["album"])
                     else None
                 ),
-                "deletehash": comic["album"]
-                if comic["album"]
-                else config.get("all_hash"),
+                "deletehash": comic["album"] if comic["album"] else all_hash,
                 "direct_link": comic["url"],
                 "image_id": comic["imgs"][0],
             },
@@ -146,11 +130,14 @@ def main():
                 "user_name": comic["user"],
             },
         }
-        new_doc_id = table.insert(new_document)
-        logging.info('Inserted new document with id "%d"', new_doc_id)
-        logging.info('Removing old doc_id of "%d"', comic.doc_id)
-        table.remove(doc_ids=[comic.doc_id])
-    logging.info("Update %d comics into new format", len(comics))
+        new_documents.append(new_document)
+    new_doc_ids = table.insert_multiple(new_documents)
+    logger.debug("Inserted new documents with ids: %s", new_doc_ids)
+    old_doc_ids = [comic.doc_id for comic in comics]
+    logger.debug("Removing old doc_ids: %s", old_doc_ids)
+    table.remove(doc_ids=old_doc_ids)
+    database.close()
+    logger.info("Update %d comics into new format", len(comics))
 
 
 if __name__ == "__main__":
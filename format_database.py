@@ -0,0 +1,31 @@
+"""Rewrite a database file as pretty or compact json
+
+:raises IOError: unable to write to database
+"""
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from twitter2reddit.database import PrettyJSONStorage
+
+
+def main():
+    """Rewrite a database file as pretty or compact json"""
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--pretty",
+        dest="pretty",
+        default=False,
+        action="store_true",
+        help="indent the json instead of writing it compact",
+    )
+    parser.add_argument("database", help="tinydb file to rewrite", metavar="DB")
+    args = parser.parse_args()
+
+    storage = PrettyJSONStorage(
+        args.database, pretty=args.pretty, last_tables=("meta",)
+    )
+    storage.write(storage.read() or {})
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,34 +6,84 @@ This file is commandline only.
 import logging
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 from datetime import datetime
+from random import uniform
 from sys import stdout
 from time import sleep
 
 from dotenv import load_dotenv
-from yaml import Loader, load
+from imgurpython.helpers.error import ImgurClientRateLimitError
+from prawcore.exceptions import RequestException, ServerError, TooManyRequests
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+from yaml import load
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
 
 from twitter2reddit import TwitterToReddit
 
 logger = logging.getLogger(__name__)
 
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+BACKOFF_JITTER = 2
+POLL_MAX = 120
+TIMELINE_MAX_AGE = 300
+TRANSIENT_ERRORS = (
+    RequestsConnectionError,
+    Timeout,
+    ImgurClientRateLimitError,
+    RequestException,
+    ServerError,
+    TooManyRequests,
+)
+
+
+def _load_yaml(filename: str) -> dict:
+    """Load a yaml file with the libyaml safe loader when it is available
+
+    :param filename: yaml file to load
+    :type filename: str
+    :return: parsed yaml
+    :rtype: dict
+    """
+    with open(filename, "rb") as fp:
+        return load(fp.read(), Loader=Loader)
+
+
 def post_today(schedule):
     now = datetime.now()
 
-    with open(schedule, "r") as fp:
-        schd = load(fp, Loader=Loader)
+    schd = _load_yaml(schedule)
 
     days = schd.get(now.year, {}).get(now.month, [])
     return now.day in days
 
 
-def main(arguments: list[str] = None) -> None:
-    """
-    Process from command line
+def _backoff(attempt: int, cap: float = BACKOFF_MAX) -> float:
+    """Seconds to wait before the next upload attempt
 
-    Use `--help` argument to get info
+    Doubles with every attempt up to `cap` and adds up to
+    `BACKOFF_JITTER` seconds of random jitter
+
+    :param attempt: number of the retry, starting at 1
+    :type attempt: int
+    :param cap: most seconds to wait before jitter, defaults to `BACKOFF_MAX`
+    :type cap: float, optional
+    :return: seconds to sleep
+    :rtype: float
     """
-    load_dotenv()
+    return min(cap, BACKOFF_BASE * 2 ** (attempt - 1)) + uniform(0, BACKOFF_JITTER)
+
+
+def _build_parser() -> ArgumentParser:
+    """Build the commandline argument parser
 
+    :return: argument parser for `main`
+    :rtype: ArgumentParser
+    """
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("--log", dest="logfile", help="log file", metavar="LOGFILE")
     parser.add_argument(
@@ -73,7 +123,7 @@ def main(arguments: list[str] = None) -> None:
         "-a",
         "--attempts",
         dest="attempts",
-        default=75,
+        default=10,
         type=int,
         help="number of times to check for new comic if none found",
         metavar="NUM",
@@ -81,53 +131,105 @@ def main(arguments: list[str] = None) -> None:
     parser.add_argument(
         "--delay",
         dest="delay",
-        default=60,
+        default=30,
         type=int,
         help="number of times to check for a new upload if it gets posted later than normal",
         metavar="NUM",
     )
+    return parser
+
+
+PARSER = _build_parser()
+
+
+def _setup_logging(logfile: str = None, mode: str = "INFO") -> None:
+    """Configure the root logger, does nothing if it already has handlers
+
+    :param logfile: file to also log to, defaults to None
+    :type logfile: str, optional
+    :param mode: level to log at, defaults to "INFO"
+    :type mode: str, optional
+    :return: none
+    :rtype: None
+    """
+    if logging.getLogger().handlers:
+        return
 
-    args = parser.parse_args(arguments)
     handler_list = (
-        [logging.StreamHandler(stdout), logging.FileHandler(args.logfile)]
-        if args.logfile
+        [logging.StreamHandler(stdout), logging.FileHandler(logfile)]
+        if logfile
         else [logging.StreamHandler(stdout)]
     )
 
     logging.basicConfig(
         format="%(asctime)s\t[%(levelname)s]\t{%(module)s}\t%(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
-        level=logging.INFO,
+        level=mode,
         handlers=handler_list,
     )
 
+
+def main(arguments: list[str] = None) -> None:
+    """
+    Process from command line
+
+    Use `--help` argument to get info
+    """
+    load_dotenv()
+
+    args = PARSER.parse_args(arguments)
+    _setup_logging(args.logfile, args.mode)
+
     if args.schedule is None or not post_today(args.schedule):
         logger.info("no posts should be made today")
         return
 
-    with open(args.filename, "r") as fp:
-        settings = load(fp, Loader=Loader)
+    settings = _load_yaml(args.filename)
 
-    attempts = 1
-    delay = 1
     t2r = TwitterToReddit(settings)
-    posts = None
-    while posts is None and delay <= args.delay:
-        posts = t2r.upload()
-        sleep(60)
-        delay += 1
-
-    while posts is not None and len(posts) == 0 and attempts <= args.attempts:
-        logger.warning(
-            (
-                "No posts were made, sleeping for 1 min to try again. "
-                "Will attempt %d more times before exiting."
-            ),
-            args.attempts - attempts,
-        )
-        sleep(60)
-        posts = t2r.upload()
-        attempts += 1
+    delay = 1
+    attempts = 0
+    max_age = 0
+    while True:
+        try:
+            posts = t2r.upload(max_age=max_age)
+        except TRANSIENT_ERRORS as e:
+            if attempts >= args.attempts:
+                raise
+            attempts += 1
+            max_age = TIMELINE_MAX_AGE
+            wait = _backoff(attempts)
+            logger.warning(
+                (
+                    "Upload failed with %r, sleeping for %.0f seconds to try again. "
+                    "Will attempt %d more times before exiting."
+                ),
+                e,
+                wait,
+                args.attempts - attempts,
+            )
+            sleep(wait)
+            continue
+        max_age = 0
+        if posts is None and delay < args.delay:
+            delay += 1
+            wait = _backoff(delay - 1, cap=POLL_MAX)
+            logger.info("No new statuses found, checking again in %.0f seconds", wait)
+        elif posts is not None and len(posts) == 0 and attempts < args.attempts:
+            attempts += 1
+            max_age = TIMELINE_MAX_AGE
+            wait = _backoff(attempts)
+            logger.warning(
+                (
+                    "No posts were made, sleeping for %.0f seconds to try again. "
+                    "Will attempt %d more times before exiting."
+                ),
+                wait,
+                args.attempts - attempts,
+            )
+        else:
+            break
+        sleep(wait)
 
     if posts is not None and len(posts) == 0:
         logger.error("No posts made successfully")
@@ -1,11 +1,13 @@
 """Twitter2Reddit uploader
 
 Classes
-    Twitter2Reddit
-    RedditPost
-    ImgurImages
+    TwitterToReddit
+    RedditApiClient
+    ImgurApiClient
+    SessionImgurClient
     ImgurAlbum
-    TweetStatus
+    ImgurImage
+    TwitterApiClient
     Database
 """
 __all__ = ["database", "imgur", "reddit", "twitter", "twitter2reddit"]
@@ -4,47 +4,139 @@ TinyDB Interface
 Classes:
     Database
 """
+import atexit
 import logging
 from io import UnsupportedOperation
-from json import dumps
 from os import fsync
 
+import orjson
 from tinydb import JSONStorage, TinyDB, where
-from tinydb.operations import increment
+from tinydb.middlewares import CachingMiddleware
+from tinydb.operations import add
 
+IMGUR_KEYS = ("album_id", "deletehash", "title", "description")
+TWITTER_KEYS = ("user_name", "user_url")
+REDDIT_KEYS = ("subreddit",)
+
+
+def _common_prefix(old: bytes, new: bytes) -> int:
+    """Length of the common prefix of two byte strings
+
+    Binary searches with memoryview comparisons so the bytes are compared in C
+
+    :param old: first byte string
+    :type old: bytes
+    :param new: second byte string
+    :type new: bytes
+    :return: number of leading bytes that are the same in both
+    :rtype: int
+    """
+    old_view, new_view = memoryview(old), memoryview(new)
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old_view[low:middle] == new_view[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
 
-class PrettyJSONStorage(JSONStorage):
-    """Store the TinyDB with pretty json
 
-    Should be passed into a TinyDB constructor as the `storage` argument
+class PrettyJSONStorage(JSONStorage):
+    """Store the TinyDB as json
+
+    Should be passed into a TinyDB constructor as the `storage` argument.
+    The file is opened in binary mode so writes can start part way through it.
+    Pass `pretty=True` to indent the json instead of writing it compact.
+    Tables named in `last_tables` are written at the end of the file so the
+    small ones that change on every run don't push the rest of the file into
+    each write.
+    Writes are only fsynced right away if the storage is durable, otherwise
+    they are synced when the storage is closed.
     """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        path: str,
+        access_mode: str = "rb+",
+        durable: bool = True,
+        pretty: bool = False,
+        last_tables: tuple[str] = (),
+        **kwargs,
+    ):
+        super().__init__(path, access_mode=access_mode, **kwargs)
+        self.durable = durable
+        self.last_tables = last_tables
+        self.option = orjson.OPT_INDENT_2 if pretty else None
+        self._unsynced = False
+        self._serialized = None
+
+    def read(self) -> dict:
+        """Read data from the database and remember its serialized form
+
+        :return: database contents, None if the file is empty
+        :rtype: dict
+        """
+        self._handle.seek(0)
+        serialized = self._handle.read()
+        if not serialized:
+            return None
+        self._serialized = serialized
+        return orjson.loads(serialized)
 
     def write(self, data: object):
-        """Write data to database in a pretty json format
+        """Write data to database as json
 
-        Indents by 4 spaces and sorts keys
+        Indents by 2 spaces if the storage is pretty, otherwise the json is
+        compact. Keys are kept in insertion order so new documents
+        end up at the end of their table. Only the part of the file after the
+        first changed byte is rewritten, nothing is written if it is unchanged
+        and the file is only truncated if it got shorter. Only fsyncs if the
+        storage is durable
 
         :param data: data to be saved in json format, needs to be json serializeable
         :type data: object
         :return: none
         :rtype: None
         """
-        self._handle.seek(0)
-        serialized = dumps(data, indent=4, sort_keys=True, **self.kwargs)
+        if self.last_tables:
+            last = {name: data[name] for name in self.last_tables if name in data}
+            data = {name: table for name, table in data.items() if name not in last}
+            data.update(last)
+        serialized = orjson.dumps(data, option=self.option)
+        if serialized == self._serialized:
+            return
+        previous = self._serialized or b""
+        start = _common_prefix(previous, serialized)
+        self._handle.seek(start)
         try:
-            self._handle.write(serialized)
+            self._handle.write(serialized[start:])
         except UnsupportedOperation as e:
             raise IOError(
                 f'Cannot write to the database. Access mode is "{self._mode}"'
             ) from e
+        if len(serialized) < len(previous):
+            self._handle.truncate()
 
         self._handle.flush()
-        fsync(self._handle.fileno())
+        if self.durable:
+            fsync(self._handle.fileno())
+        else:
+            self._unsynced = True
+
+        self._serialized = serialized
 
-        self._handle.truncate()
+    def close(self) -> None:
+        """Fsync any writes that were skipped and close the file
+
+        :return: none
+        :rtype: None
+        """
+        if self._unsynced:
+            fsync(self._handle.fileno())
+            self._unsynced = False
+        super().close()
 
 
 class Database:
@@ -54,35 +146,109 @@ class Database:
     Args:
         filename (str): tinyDB file
         table (str): name of table to get data from
+        first_time (dict): meta settings to set up the table with
+        durable (bool): fsync every flush instead of only when closing
+        storage_options: passed on to `PrettyJSONStorage`, like `pretty` to indent
+            the json in the file instead of writing it compact
 
     Attributes:
         table_name (str): name of table for data
-        database (TinyDB): tinyDB database
+        database (TinyDB): tinyDB database, writes are cached until `flush`
+            and fsynced when it is closed unless it is durable
         table (Table): table instance from TinyDB database
+        meta_query (QueryInstance): query for the table's document in the meta table
         number_id (int): doc_id of the number tracker
+        status_ids (dict[int, int]): doc_id of each twitter status_id in the table
 
     Methods:
         upsert: upsert new data to the table
-        check_upload: check if a key/value pair exists
-        get_docs: get docts where is matches one of multiple vals for key
-        get_number: get current image number
-        increment_number: increase image number by 1
+        upsert_many: upsert multiple documents in one table write
+        check_upload: get the document for a twitter status_id
+        is_posted: check if a document has been posted and commented on reddit
+        since_id: newest status_id that doesn't need to be fetched again
+        increment_number: increase image number
+        flush: write cached changes to the database file
+        close: flush and close the database file
     """
 
-    def __init__(self, filename: str, table: str, first_time: dict = None) -> None:
+    def __init__(
+        self,
+        filename: str,
+        table: str,
+        first_time: dict = None,
+        durable: bool = False,
+        **storage_options,
+    ) -> None:
         self.table_name = table
-        self.database = TinyDB(filename, storage=PrettyJSONStorage)
+        self.database = TinyDB(
+            filename,
+            storage=CachingMiddleware(PrettyJSONStorage),
+            durable=durable,
+            last_tables=("meta",),
+            **storage_options,
+        )
+        atexit.register(self.close)
         self.table = self.database.table(self.table_name)
         self.meta = self.database.table("meta")
-        if first_time:
+        self.meta_query = where("table") == self.table_name
+        self._settings = None
+        document = self.meta.get(self.meta_query)
+        if document is not None:
+            self.number_id = document.doc_id
+            if first_time:
+                logging.debug(
+                    'Meta info for table "%s" already exists, skipping first_time',
+                    self.table_name,
+                )
+        elif first_time:
             first_time = self._check_first_time(first_time, table)
-            self.meta.upsert(first_time, where("table") == first_time["table"])
-        self.number_id = None
+            self.number_id = self.meta.insert(first_time)
+            self.flush()
+        else:
+            self.number_id = None
+        self.status_ids = {
+            document["twitter"]["status_id"]: document.doc_id
+            for document in self.table.all()
+            if "twitter" in document
+        }
+
+    @staticmethod
+    def _nest(first_time: dict, section: str, keys: tuple[str]) -> dict:
+        """Move flat structure keys from the root of first_time into their section
+
+        :param first_time: dictionary of first_time setup values
+        :type first_time: dict
+        :param section: name of the section the keys belong in
+        :type section: str
+        :param keys: keys that can be given at the root instead of in the section
+        :type keys: tuple[str]
+        :raises KeyError: a key is given at the root and in the section with
+            different values
+        :return: the section, None if it isn't in first_time
+        :rtype: dict
+        """
+        flat = {key: first_time.pop(key) for key in keys if key in first_time}
+        nested = first_time.get(section)
+        if not flat:
+            return nested
+        nested = {} if nested is None else nested
+        for key, value in flat.items():
+            if key in nested and nested[key] != value:
+                raise KeyError(
+                    (
+                        f"Duplicate {key} listed at root and in {section}: "
+                        f"{value} vs {nested[key]}"
+                    )
+                )
+        first_time[section] = nested = {**flat, **nested}
+        return nested
 
     @staticmethod
     def _check_first_time(first_time: dict, table: str) -> dict:
         """Verify first_time settings are valid
 
+        Accepts the verbose or flat structure and returns the verbose one
+
         :param first_time: dictionary of first_time setup values
         :type first_time: dict
         :param table: table name to store info
@@ -90,9 +256,7 @@ class Database:
         :return: validated settings
         :rtype: dict
         """
-        if "table" not in first_time:
-            first_time["table"] = table
-        elif first_time["table"] != table:
+        if first_time.setdefault("table", table) != table:
             raise KeyError(
                 (
                     f"Table does not match settings table name: "
@@ -100,100 +264,56 @@ class Database:
                 )
             )
 
-        if "number" not in first_time:
-            first_time["number"] = 1
-
-        if "imgur" not in first_time:
-            album_id = first_time.get("album_id")
-            deletehash = first_time.get("deletehash")
-            title = first_time["title"]
-            description = (
-                first_time["description"]
-                if "description" in first_time
-                else (
-                    f"{title} art by @{first_time['twitter']['user_name']} "
-                    f"- https://twitter.com/{first_time['twitter']['user_name']}"
-                )
+        first_time.setdefault("number", 1)
+
+        twitter = Database._nest(first_time, "twitter", TWITTER_KEYS) or {}
+        if "user_name" in twitter:
+            twitter.setdefault(
+                "user_url", f"https://twitter.com/{twitter['user_name']}"
             )
 
-            first_time["imgur"] = {
-                "album_id": album_id,
-                "deletehash": deletehash,
-                "description": description,
-                "title": title,
-            }
-        first_time.pop("album_id", None)
-        first_time.pop("deletehash", None)
-        first_time.pop("title", None)
-        first_time.pop("description", None)
-
-        if "user_name" in first_time and "twitter" not in first_time:
-            first_time["twitter"] = {
-                "user_name": first_time["user_name"],
-                "user_url": first_time["user_url"]
-                if "user_url" in first_time
-                else f"https://twitter.com/{first_time['user_name']}",
-            }
-        elif (
-            "user_name" in first_time
-            and "user_name" in first_time["twitter"]
-            and first_time["user_name"] != first_time["twitter"]["user_name"]
-        ):
-            raise KeyError(
-                (
-                    f"Duplicate user names listed at root and in twitter: "
-                    f"{first_time['user_name']} vs {first_time['twitter']['user_name']}"
-                )
+        Database._nest(first_time, "reddit", REDDIT_KEYS)
+
+        Database._nest(first_time, "imgur", IMGUR_KEYS)
+        imgur = first_time.setdefault("imgur", {})
+        imgur.setdefault("album_id", None)
+        imgur.setdefault("deletehash", None)
+        if "description" not in imgur and "title" in imgur and "user_name" in twitter:
+            imgur["description"] = (
+                f"{imgur['title']} art by @{twitter['user_name']} "
+                f"- {twitter['user_url']}"
             )
-        first_time.pop("user_name", None)
-        first_time.pop("user_url", None)
-
-        if "subreddit" in first_time and "reddit" not in first_time:
-            first_time["reddit"] = {"subreddit": first_time["subreddit"]}
-        elif (
-            "subreddit" in first_time
-            and "reddit" in first_time
-            and "subreddit" not in first_time["reddit"]
-        ):
-            first_time["reddit"] = {"subreddit": first_time["subreddit"]}
-        elif (
-            "subreddit" in first_time
-            and "reddit" in first_time
-            and "subreddit" in first_time["reddit"]
-        ):
-            if first_time["subreddit"] != first_time["reddit"]["subreddit"]:
-                raise KeyError(
-                    (
-                        f"Duplicate subreddits listed at root and in reddit: "
-                        f"{first_time['subreddit']} vs {first_time['reddit']['subreddit']}"
-                    )
-                )
-        first_time.pop("subreddit", None)
 
         return first_time
 
     def update_meta(self, update: dict) -> dict:
-        """Update meta table info
+        """Update meta table info and write it to the database file right away
 
         :param update: dictionary with updated data
         :type update: dict
         :return: full settings dictionary with updated values
         :rtype: dict
         """
-        self.meta.update(update, where("table") == self.table_name)
+        self.meta.update(update, self.meta_query)
+        self._settings = None
+        self.flush()
         return self.get_settings()
 
     def get_settings(self) -> dict:
         """Get meta settings for the table
 
+        The settings are read once and kept until the meta table is changed
+
         :return: meta dict
         :rtype: dict
         """
-        if not self.number_id:
-            results = self.meta.search(where("table") == self.table_name)
-            self.number_id = results[0].doc_id
-        settings = self.meta.get(doc_id=self.number_id)
-        return settings
+        if self._settings is None:
+            if not self.number_id:
+                self._settings = self.meta.get(self.meta_query)
+                self.number_id = self._settings.doc_id
+            else:
+                self._settings = self.meta.get(doc_id=self.number_id)
+        return self._settings
 
     def upsert(self, data: dict, status_id: str) -> list[int]:
         """Upsert data into database
@@ -211,7 +331,57 @@ class Database:
             status_id,
             data,
         )
-        return self.table.upsert(data, where("twitter").status_id == status_id)
+        doc_id = self.status_ids.get(status_id)
+        if doc_id is None:
+            doc_id = self.table.insert(data)
+            self.status_ids[status_id] = doc_id
+            return [doc_id]
+        return self.table.update(data, doc_ids=[doc_id])
+
+    def upsert_many(self, documents: list[dict]) -> list[int]:
+        """Upsert multiple documents, matching each on its twitter status_id
+
+        Existing documents are updated together by doc_id and the rest are
+        inserted together
+
+        :param documents: documents to upsert
+        :type documents: list[dict]
+        :return: list of updated and inserted doc_ids
+        :rtype: list[int]
+        """
+        by_status = {
+            document["twitter"]["status_id"]: document for document in documents
+        }
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(
+                'Upserting %d documents into table "%s" for status_ids: %s',
+                len(by_status),
+                self.table_name,
+                list(by_status),
+            )
+        doc_ids = []
+        existing = [
+            self.status_ids[status_id]
+            for status_id in by_status
+            if status_id in self.status_ids
+        ]
+        if existing:
+
+            def _update(document: dict) -> None:
+                document.update(by_status[document["twitter"]["status_id"]])
+
+            doc_ids.extend(self.table.update(_update, doc_ids=existing))
+
+        missing = [
+            status_id for status_id in by_status if status_id not in self.status_ids
+        ]
+        if missing:
+            inserted = self.table.insert_multiple(
+                by_status[status_id] for status_id in missing
+            )
+            self.status_ids.update(zip(missing, inserted))
+            doc_ids.extend(inserted)
+        return doc_ids
 
     def check_upload(self, status_id: str) -> dict:
         """Check if documents exist where key has value of val
@@ -226,14 +396,66 @@ class Database:
             self.table_name,
             status_id,
         )
-        result = self.table.search(where("twitter").status_id == status_id)
-        return result[0] if result else None
+        doc_id = self.status_ids.get(status_id)
+        return None if doc_id is None else self.table.get(doc_id=doc_id)
 
-    def increment_number(self) -> int:
-        """Incrament current comic number by one
+    @staticmethod
+    def is_posted(document: dict) -> bool:
+        """Check if a document has been posted and commented on reddit
 
+        :param document: document for a twitter status
+        :type document: dict
+        :return: True if it has both a reddit post and comment
+        :rtype: bool
+        """
+        reddit = document.get("reddit") or {}
+        return reddit.get("post") is not None and reddit.get("comment") is not None
+
+    def since_id(self) -> int:
+        """Get the newest status_id that doesn't need to be fetched from twitter again
+
+        Every status after it is either new or hasn't finished uploading,
+        statuses that are missing a reddit post or comment keep it behind them
+
+        :return: status_id to fetch newer statuses than, None if there are none
+        :rtype: int
+        """
+        incomplete = [
+            document["twitter"]["status_id"]
+            for document in self.table
+            if "twitter" in document
+            and (not document.get("comic") or not self.is_posted(document))
+        ]
+        if incomplete:
+            return min(incomplete) - 1
+        return max(self.status_ids, default=None)
+
+    def increment_number(self, amount: int = 1) -> int:
+        """Incrament current comic number
+
+        :param amount: how much to increase the number by, defaults to 1
+        :type amount: int, optional
         :return: increased number
         :rtype: int
         """
-        self.meta.update(increment("number"), doc_ids=[self.number_id])
-        return self.get_settings()["number"]
+        settings = self.get_settings()
+        self.meta.update(add("number", amount), doc_ids=[self.number_id])
+        settings["number"] += amount
+        return settings["number"]
+
+    def flush(self) -> None:
+        """Write cached changes to the database file
+
+        :return: none
+        :rtype: None
+        """
+        logging.debug('Flushing database changes for table "%s"', self.table_name)
+        self.database.storage.flush()
+
+    def close(self) -> None:
+        """Flush cached changes and close the database file
+
+        :return: none
+        :rtype: None
+        """
+        self.database.close()
@@ -2,18 +2,187 @@
 Upload images to Imgur
 
 Classes:
+    PartialUploadError
+    RequestRetry
+    SessionImgurClient
     ImgurAlbum
     ImgurImage
+    ImgurApiClient
 """
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from os import getenv
 
 from imgurpython import ImgurClient
+from imgurpython.client import API_URL, MASHAPE_URL
+from imgurpython.helpers.error import ImgurClientError, ImgurClientRateLimitError
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+UPLOAD_WORKERS = 4
+
+
+class RequestRetry(Retry):
+    """Retry that only retries requests that aren't idempotent on a rate limit
+
+    A server error from imgur can come after an upload was stored, so retrying
+    a POST could upload the image twice. A rate limit is rejected before
+    anything is stored so it is safe to retry
+    """
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        """Check if a response should be retried
+
+        :param method: http method of the request
+        :type method: str
+        :param status_code: response status code
+        :type status_code: int
+        :param has_retry_after: response has a Retry-After header, defaults to False
+        :type has_retry_after: bool, optional
+        :return: True if the request should be sent again
+        :rtype: bool
+        """
+        if method.upper() not in self.DEFAULT_ALLOWED_METHODS and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+REQUEST_RETRIES = RequestRetry(
+    total=3,
+    read=0,
+    backoff_factor=1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=None,
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+
+
+class PartialUploadError(Exception):
+    """An upload in a batch failed after other uploads had already finished
+
+    Attributes:
+        image_ids (list[int]): imgur image ids in the same order as the statuses,
+            None for uploads that failed or were cancelled
+        error (Exception): first error raised by an upload
+    """
+
+    def __init__(self, image_ids: list[int], error: Exception):
+        super().__init__(
+            f"{len(image_ids) - image_ids.count(None)} of {len(image_ids)} "
+            f"images uploaded before: {error!r}"
+        )
+        self.image_ids = image_ids
+        self.error = error
+
+
+class SessionImgurClient(ImgurClient):
+    """Imgur client that sends its requests through one keep-alive session
+
+    imgurpython calls the module level `requests` functions, which open a new
+    connection for every request. The session pools connections to the api
+    so only the first request pays for the TLS handshake. Failed connections
+    and rate limits are retried with `REQUEST_RETRIES`, server errors only for
+    requests that don't upload anything. Reads that fail after the request was
+    sent are not retried so uploads aren't duplicated
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.session = Session()
+        self.session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=UPLOAD_WORKERS,
+                max_retries=REQUEST_RETRIES,
+            ),
+        )
+        super().__init__(*args, **kwargs)
+
+    def _send(self, method: str, url: str, data: dict, force_anon: bool) -> Response:
+        """Send one request to the imgur api with the current auth headers
+
+        :param method: lowercase http method
+        :type method: str
+        :param url: full api url
+        :type url: str
+        :param data: request data
+        :type data: dict
+        :param force_anon: use the client id instead of the access token
+        :type force_anon: bool
+        :return: api response
+        :rtype: Response
+        """
+        headers = self.prepare_headers(force_anon)
+        params = data if method in ("delete", "get") else None
+        return self.session.request(
+            method, url, headers=headers, params=params, data=data
+        )
+
+    def make_request(
+        self, method: str, route: str, data: dict = None, force_anon: bool = False
+    ) -> dict:
+        """Make an imgur api request, same as `ImgurClient.make_request`
+
+        :param method: http method
+        :type method: str
+        :param route: api route
+        :type route: str
+        :param data: request data, defaults to None
+        :type data: dict, optional
+        :param force_anon: use the client id instead of the access token,
+            defaults to False
+        :type force_anon: bool, optional
+        :raises ImgurClientRateLimitError: rate limit was hit
+        :raises ImgurClientError: the response is not valid or has an error
+        :return: response data
+        :rtype: dict
+        """
+        method = method.lower()
+        url = (MASHAPE_URL if self.mashape_key is not None else API_URL) + (
+            f"3/{route}" if "oauth2" not in route else route
+        )
+
+        response = self._send(method, url, data, force_anon)
+        if response.status_code == 403 and self.auth is not None:
+            self.auth.refresh()
+            response = self._send(method, url, data, False)
+
+        self.credits = {
+            "UserLimit": response.headers.get("X-RateLimit-UserLimit"),
+            "UserRemaining": response.headers.get("X-RateLimit-UserRemaining"),
+            "UserReset": response.headers.get("X-RateLimit-UserReset"),
+            "ClientLimit": response.headers.get("X-RateLimit-ClientLimit"),
+            "ClientRemaining": response.headers.get("X-RateLimit-ClientRemaining"),
+        }
+
+        if response.status_code == 429:
+            raise ImgurClientRateLimitError()
+
+        try:
+            response_data = response.json()
+        except ValueError as e:
+            raise ImgurClientError("JSON decoding of response failed.") from e
+
+        if (
+            "data" in response_data
+            and isinstance(response_data["data"], dict)
+            and "error" in response_data["data"]
+        ):
+            raise ImgurClientError(response_data["data"]["error"], response.status_code)
+
+        return response_data["data"] if "data" in response_data else response_data
 
 
 class ImgurAlbum:
     """Imgur Album Interface"""
 
+    __slots__ = ("deletehash", "album_id", "config")
+
     # pylint: disable=too-many-arguments
     def __init__(
         self,
@@ -90,6 +259,8 @@ class ImgurAlbum:
 class ImgurImage:
     """Imgur Image Interface"""
 
+    __slots__ = ("status", "deletehash", "image_id")
+
     def __init__(self, status: dict, deletehash: str = None):
         self.status = status
         self.deletehash = deletehash
@@ -110,12 +281,15 @@ class ImgurImage:
             'Generating imgur image upload config for album "%s"', self.deletehash
         )
         twitter = self.status["twitter"]
-        comic = self.status["comic"]
+        number = self.status["comic"]["number"]
 
-        title = f"#{comic['number']} - {twitter['text']} - @{twitter['user_name']}"
+        text = twitter["text"]
+        user_name = twitter["user_name"]
+
+        title = f"#{number} - {text} - @{user_name}"
         description = (
-            f"{twitter['display_name']} (@{twitter['user_name']})\n#{comic['number']} - "
-            f"{twitter['text']}\n\nCreated: {twitter['date']}\t{twitter['tweet']}"
+            f"{twitter['display_name']} (@{user_name})\n#{number} - {text}"
+            f"\n\nCreated: {twitter['date']}\t{twitter['tweet']}"
         )
 
         return {
@@ -135,10 +309,10 @@ class ImgurImage:
         """
         if self.image_id is None:
             logging.info('Uploading image to album "%s"', self.deletehash)
-            print(self.status["twitter"]["media"], self.gen_config())
-            ret = client.upload_from_url(
-                self.status["twitter"]["media"], config=self.gen_config(), anon=False
-            )
+            media = self.status["twitter"]["media"]
+            config = self.gen_config()
+            logging.debug('Uploading "%s" with config: %s', media, config)
+            ret = client.upload_from_url(media, config=config, anon=False)
             self.image_id = ret["id"]
         else:
             logging.info(
@@ -159,14 +333,18 @@ class ImgurApiClient:
             self.album = self.create_album(settings=settings)
 
     @staticmethod
+    @lru_cache(maxsize=1)
     def get_imgur() -> ImgurClient:
-        """Get an imgur api client
+        """Get an imgur api client that reuses its connections
+
+        The client is only created once so every `ImgurApiClient` shares its
+        session and access token
 
         :return: imgur api client
         :rtype: ImgurClient
         """
         logging.debug("Generating Imgur Client")
-        return ImgurClient(
+        return SessionImgurClient(
             client_id=getenv("IMGUR_CLIENT"),
             client_secret=getenv("IMGUR_SECRET"),
             access_token=getenv("IMGUR_ACCESS_TOKEN"),
@@ -219,3 +397,38 @@ class ImgurApiClient:
         :rtype: int
         """
         return ImgurImage(status, self.album.deletehash).upload(self.api)
+
+    def upload_images(self, statuses: list[dict]) -> list[int]:
+        """Upload first image from multiple tweets concurrently
+
+        Uploads run on a thread pool of `UPLOAD_WORKERS` threads. When one fails
+        the uploads that haven't started are cancelled and the ones already
+        running are waited on
+
+        :param statuses: statuses with info for each image
+        :type statuses: list[dict]
+        :raises PartialUploadError: an upload failed, has the ids of the uploads
+            that finished
+        :return: imgur image ids in the same order as the statuses
+        :rtype: list[int]
+        """
+        if len(statuses) <= 1:
+            return [self.upload_image(status) for status in statuses]
+        image_ids = []
+        with ThreadPoolExecutor(
+            max_workers=min(UPLOAD_WORKERS, len(statuses))
+        ) as executor:
+            futures = [
+                executor.submit(self.upload_image, status) for status in statuses
+            ]
+            for index, future in enumerate(futures):
+                try:
+                    image_ids.append(future.result())
+                except Exception as error:
+                    executor.shutdown(cancel_futures=True)
+                    image_ids.append(None)
+                    for pending in futures[index + 1 :]:
+                        failed = pending.cancelled() or pending.exception() is not None
+                        image_ids.append(None if failed else pending.result())
+                    raise PartialUploadError(image_ids, error) from error
+        return image_ids
@@ -2,12 +2,19 @@
 Post tweets to Reddit
 
 Classes:
-    RedditPost
+    RedditApiClient
 """
 import logging
 from os import getenv
 
 from praw import Reddit
+from praw.models import Subreddit
+
+COMMENT_TEMPLATE = (
+    "{display_name} (@{user_name})\n{text}\n\n{tweet}"
+    "\n\n&nbsp;\n\n^(I am a bot developed by /u/spsseano. My source code can "
+    "be found at https://github.com/spslater/twitter2reddit)"
+)
 
 
 class RedditApiClient:
@@ -15,6 +22,7 @@ class RedditApiClient:
 
     def __init__(self):
         self.api = self.get_client()
+        self.subreddits = {}
 
     @staticmethod
     def get_client():
@@ -41,16 +49,19 @@ class RedditApiClient:
         :return: comment text
         :rtype: str
         """
-        display_name = document["twitter"]["display_name"]
-        user_name = document["twitter"]["user_name"]
-        text = document["twitter"]["text"]
-        tweet = document["twitter"]["tweet"]
+        return COMMENT_TEMPLATE.format_map(document["twitter"])
 
-        return (
-            f"{display_name} (@{user_name})\n{text}\n\n{tweet}"
-            "\n\n&nbsp;\n\n^(I am a bot developed by /u/spsseano. My source code can "
-            "be found at https://github.com/spslater/twitter2reddit)"
-        )
+    def get_subreddit(self, subreddit_name: str) -> Subreddit:
+        """Get a subreddit, reusing the object if it was already created
+
+        :param subreddit_name: subreddit name
+        :type subreddit_name: str
+        :return: subreddit object
+        :rtype: Subreddit
+        """
+        if subreddit_name not in self.subreddits:
+            self.subreddits[subreddit_name] = self.api.subreddit(subreddit_name)
+        return self.subreddits[subreddit_name]
 
     def upload(self, subreddit_name: str, document: dict) -> tuple[str, str]:
         """Upload a post to reddit
@@ -62,28 +73,35 @@ class RedditApiClient:
         :return: updated document with submission url and comment url
         :rtype: dict
         """
-        image_link = document["imgur"]["direct_link"]
+        image_link = document["imgur"].get("direct_link")
         title = document["comic"]["title"]
         post_url = document["reddit"].get("post")
         comment_url = document["reddit"].get("comment")
-        subreddit = self.api.subreddit(subreddit_name)
-        comment_text = self._get_comment_text(document)
 
-        if not post_url:
+        if not post_url and not image_link:
+            logging.warning(
+                'No imgur link for status "%s", not submitting to reddit',
+                document["twitter"]["status_id"],
+            )
+            document["reddit"].setdefault("post", None)
+            document["reddit"].setdefault("comment", None)
+        elif not post_url:
             logging.info(
                 'Submitting Reddit link to subreddit "%s" for images "%s"',
                 subreddit_name,
                 image_link,
             )
-            submission = subreddit.submit(title=title, url=image_link)
+            submission = self.get_subreddit(subreddit_name).submit(
+                title=title, url=image_link
+            )
             submission.disable_inbox_replies()
             document["reddit"]["post"] = submission.permalink
-            info = submission.reply(comment_text)
+            info = submission.reply(self._get_comment_text(document))
             document["reddit"]["comment"] = info.permalink
         elif not comment_url:
             logging.info("Already submitted Reddit link leaving comment: %s", post_url)
             submission = self.api.get(post_url)
-            info = submission.reply(comment_text)
+            info = submission.reply(self._get_comment_text(document))
             document["reddit"]["comment"] = info.permalink
         else:
             logging.info(
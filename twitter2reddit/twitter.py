@@ -2,15 +2,37 @@
 Manage twitter statuses
 
 Classes:
-    TwitterStatus
+    TwitterApiClient
 """
 import logging
-import re
-from datetime import datetime
 from os import getenv
+from time import localtime, monotonic, strftime
 
 from twitter import Api as Twitter
-from twitter.models import Media
+from twitter.models import Media, Status
+
+TCO_LINK = "https://t.co/"
+
+
+def _strip_links(text: str) -> str:
+    """Remove the trailing t.co links twitter adds to a status's text
+
+    Same result as removing `\\s+https://t\\.co/.*$` but without the regex engine,
+    only links on the last line that follow whitespace are stripped
+
+    :param text: status text
+    :type text: str
+    :return: text without the trailing links
+    :rtype: str
+    """
+    trailing = text.endswith("\n")
+    body = text[:-1] if trailing else text
+    start = body.find(TCO_LINK, body.rfind("\n") + 1)
+    while start != -1 and (start == 0 or not body[start - 1].isspace()):
+        start = body.find(TCO_LINK, start + 1)
+    if start == -1:
+        return text
+    return body[:start].rstrip() + ("\n" if trailing else "")
 
 
 class TwitterApiClient:
@@ -18,6 +40,7 @@ class TwitterApiClient:
 
     def __init__(self):
         self.api = self.get_client()
+        self.timelines = {}
 
     @staticmethod
     def get_client() -> Twitter:
@@ -49,35 +72,75 @@ class TwitterApiClient:
         :return: direct url for the image
         :rtype: str
         """
-        size = "?name=large" if "large" in media.sizes else ""
-        return f"{media.media_url_https}{size}"
+        if "large" in media.sizes:
+            return f"{media.media_url_https}?name=large"
+        return media.media_url_https
+
+    def convert_status(self, status: Status) -> dict:
+        """Convert a twitter status into the info stored in the database
 
-    def _convert_status(self, status):
+        :param status: status from the twitter api
+        :type status: Status
+        :return: document with the twitter info filled in
+        :rtype: dict
+        """
         return {
             "twitter": {
                 "status_id": status.id,
-                "date": datetime.fromtimestamp(status.created_at_in_seconds).strftime(
-                    "%Y-%m-%d %H:%M:%S"
+                "date": strftime(
+                    "%Y-%m-%d %H:%M:%S", localtime(status.created_at_in_seconds)
                 ),
                 "user_name": status.user.screen_name,
                 "display_name": status.user.name,
                 "tweet": f"https://twitter.com/{status.user.screen_name}/status/{status.id}",
-                "text": re.sub(r"\s+https://t.co/.*?$", "", status.text),
+                "text": _strip_links(status.text),
                 "media": self._media_url(status.media[0]) if status.media else None,
             }
         }
 
-    def get_recent_statuses(self, user_name: str, recent: int = 15) -> list[dict]:
-        """Get most recent tweets from user
+    def get_recent_statuses(
+        self,
+        user_name: str,
+        recent: int = 15,
+        max_age: float = 0,
+        since_id: int = None,
+    ) -> list[Status]:
+        """Get most recent tweets with media from user, oldest first
+
+        Statuses are returned as is, use `convert_status` to get the info to store
 
         :param user_name: twitter @ username
         :type user_name: str
         :param recent: number of recent tweet statuses to get, defaults to 15
         :type recent: int, optional
-        :return: list of recent statuses
-        :rtype: list[dict]
+        :param max_age: seconds a previously fetched timeline can be reused for,
+            defaults to 0 to always fetch
+        :type max_age: float, optional
+        :param since_id: only get statuses newer than this id, defaults to None
+        :type since_id: int, optional
+        :return: list of recent statuses, newest last
+        :rtype: list[Status]
         """
-        statuses = self.api.GetUserTimeline(
-            screen_name=user_name, count=recent, exclude_replies=True, include_rts=False
+        fetched, fetched_since, statuses = self.timelines.get(
+            (user_name, recent), (None, None, None)
         )
-        return reversed([self._convert_status(status) for status in statuses if status.media])
+        if (
+            fetched is not None
+            and monotonic() - fetched < max_age
+            and (fetched_since is None or (since_id or 0) >= fetched_since)
+        ):
+            logging.debug("Reusing cached timeline for @%s", user_name)
+        else:
+            statuses = self.api.GetUserTimeline(
+                screen_name=user_name,
+                since_id=since_id,
+                count=recent,
+                exclude_replies=True,
+                include_rts=False,
+            )
+            self.timelines[(user_name, recent)] = (monotonic(), since_id, statuses)
+        return [
+            status
+            for status in reversed(statuses)
+            if status.media and (since_id is None or status.id > since_id)
+        ]
@@ -5,9 +5,10 @@ Classes:
     TwitterToReddit
 """
 import logging
+from functools import cached_property
 
 from .database import Database
-from .imgur import ImgurApiClient
+from .imgur import ImgurApiClient, PartialUploadError
 from .reddit import RedditApiClient
 from .twitter import TwitterApiClient
 
@@ -21,81 +22,129 @@ class TwitterToReddit:
             filename=env_settings["database"],
             table=env_settings["table"],
             first_time=env_settings.get("first_time"),
+            durable=env_settings.get("durable", False),
+            pretty=env_settings.get("pretty", False),
         )
         self.settings = self.database.get_settings()
 
         self.twitter = TwitterApiClient()
-        self.imgur = ImgurApiClient(settings=self.settings)
-        self.reddit = RedditApiClient()
 
+        self.number = self.settings["number"]
+
+        self.user = self.settings["twitter"]["user_name"]
+        self.subreddit = self.settings["reddit"]["subreddit"]
+        self.only_recent = env_settings.get("only_recent", False)
+
+    @cached_property
+    def imgur(self) -> ImgurApiClient:
+        """Imgur client, created the first time an image is uploaded
+
+        Runs without new statuses don't connect to imgur or create the album
+
+        :return: imgur client uploading to the table's album
+        :rtype: ImgurApiClient
+        """
+        imgur = ImgurApiClient(settings=self.settings)
         if self.settings["imgur"]["deletehash"] is None:
             self.settings = self.database.update_meta(
                 {
                     "imgur": {
-                        "deletehash": self.imgur.album.deletehash,
-                        "album_id": self.imgur.album.album_id,
+                        "deletehash": imgur.album.deletehash,
+                        "album_id": imgur.album.album_id,
                     }
                 }
             )
+        return imgur
 
-        self.number = self.settings["number"]
+    @cached_property
+    def reddit(self) -> RedditApiClient:
+        """Reddit client, created the first time a status is posted
 
-        self.user = self.database.get_settings()["twitter"]["user_name"]
-        self.subreddit = self.database.get_settings()["reddit"]["subreddit"]
-        self.only_recent = env_settings.get("only_recent", False)
+        :return: reddit client
+        :rtype: RedditApiClient
+        """
+        return RedditApiClient()
 
-    def get_statuses(self) -> tuple[list[dict], list[dict]]:
-        """Get recent twitter statuses"""
+    def get_statuses(self, max_age: float = 0) -> tuple[list[dict], list[dict]]:
+        """Get recent twitter statuses
+
+        :param max_age: seconds a previously fetched timeline can be reused for,
+            defaults to 0 to always fetch
+        :type max_age: float, optional
+        :return: statuses partially uploaded and statuses not uploaded yet
+        :rtype: tuple[list[dict], list[dict]]
+        """
         logging.info("Getting recent statuses from Twitter for @%s", self.user)
-        statuses = self.twitter.get_recent_statuses(user_name=self.user)
+        statuses = self.twitter.get_recent_statuses(
+            user_name=self.user, max_age=max_age, since_id=self.database.since_id()
+        )
         if self.only_recent:
-            statuses = list(statuses)[-1:]
+            statuses = statuses[-1:]
         partial = []
         unchecked = []
+        new = []
         for status in statuses:
-            if status["twitter"]["media"]:
-                document = self.database.check_upload(status["twitter"]["status_id"])
-                if document is None:
-                    status.update({"comic": {}, "imgur": {}, "reddit": {}})
-                    self.database.upsert(status, status["twitter"]["status_id"])
-                    unchecked.append(status)
-                elif document and not document["comic"]:
-                    unchecked.append(status)
-                elif document and (
-                    document["reddit"].get("post") is None
-                    or document["reddit"].get("comment") is None
-                ):
-                    partial.append(document)
-                else:
-                    logging.debug(
-                        'Status "%d" already uploaded to reddit',
-                        status["twitter"]["status_id"],
-                    )
+            document = self.database.check_upload(status.id)
+            if document is None:
+                document = self.twitter.convert_status(status)
+                document.update({"comic": {}, "imgur": {}, "reddit": {}})
+                new.append(document)
+                unchecked.append(document)
+            elif not document["comic"] or not document["imgur"].get("direct_link"):
+                unchecked.append(document)
+            elif not self.database.is_posted(document):
+                partial.append(document)
+            else:
+                logging.debug('Status "%d" already uploaded to reddit', status.id)
+        if new:
+            self.database.upsert_many(new)
         return partial, unchecked
 
     def to_imgur(self, statuses):
         """Upload twitter images to imgur"""
         logging.info("Uploaded %d tweet images to imgur", len(statuses))
         update_statuses = []
+        if not statuses:
+            return update_statuses
+        album = {
+            "deletehash": self.imgur.album.deletehash,
+            "album_id": self.imgur.album.album_id,
+        }
+        number = self.number
         for status in statuses:
-            status.update(
-                {
-                    "imgur": {
-                        "deletehash": self.imgur.album.deletehash,
-                        "album_id": self.imgur.album.album_id,
-                    },
-                    "comic": {
-                        "number": self.number,
-                        "title": f"#{self.number} - {status['twitter']['text']}",
-                    },
+            status["imgur"] = {**album}
+            if not status["comic"]:
+                status["comic"] = {
+                    "number": number,
+                    "title": f"#{number} - {status['twitter']['text']}",
                 }
+                number += 1
+        try:
+            image_ids = self.imgur.upload_images(statuses)
+            error = None
+        except PartialUploadError as e:
+            image_ids, error = e.image_ids, e.error
+        saved = []
+        for offset, (status, image_id) in enumerate(zip(statuses, image_ids)):
+            if image_id is not None:
+                status["imgur"]["image_id"] = image_id
+                status["imgur"]["direct_link"] = f"https://i.imgur.com/{image_id}.jpg"
+                update_statuses.append(status)
+                saved = statuses[: offset + 1]
+        if saved:
+            # failed uploads before the last finished one keep their numbers
+            # so they are retried in order on the next run
+            self.database.upsert_many(saved)
+            top = max(status["comic"]["number"] for status in saved)
+            if top >= self.number:
+                self.number = self.database.increment_number(top + 1 - self.number)
+        if error is not None:
+            logging.warning(
+                "Imgur upload failed after %d of %d images were uploaded",
+                len(update_statuses),
+                len(statuses),
             )
-            image_id = self.imgur.upload_image(status)
-            status["imgur"]["image_id"] = image_id
-            status["imgur"]["direct_link"] = f"https://i.imgur.com/{image_id}.jpg"
-            self.database.upsert(status, status["twitter"]["status_id"])
-            update_statuses.append(status)
-            self.number = self.database.increment_number()
+            raise error
         return update_statuses
 
     def to_reddit(self, statuses: list[dict]) -> list[str]:
@@ -108,8 +157,11 @@ class TwitterToReddit:
         """
         logging.info("Posting %d imgur links to /r/%s", len(statuses), self.subreddit)
         posts = []
+        if not statuses:
+            return posts
+        subreddit = self.subreddit
         for status in statuses:
-            status = self.reddit.upload(self.subreddit, status)
+            status = self.reddit.upload(subreddit, status)
             post = status["reddit"]["post"]
             comment = status["reddit"]["comment"]
 
@@ -117,13 +169,17 @@ class TwitterToReddit:
                 logging.warning("Reddit posting not successful.")
             else:
                 self.database.upsert(status, status["twitter"]["status_id"])
+                self.database.flush()
                 posts.append(post)
                 logging.info("Reddit Post: %s", post)
         return posts
 
-    def upload(self) -> list[str]:
+    def upload(self, max_age: float = 0) -> list[str]:
         """Get twitter statuses and upload to reddit
 
+        :param max_age: seconds a previously fetched timeline can be reused for,
+            defaults to 0 to always fetch
+        :type max_age: float, optional
         :return: list of reddit submission urls
         :rtype: list[str]
         """
@@ -132,11 +188,15 @@ class TwitterToReddit:
             self.user,
             self.subreddit,
         )
-        uploaded, unchecked = self.get_statuses()
+        uploaded, unchecked = self.get_statuses(max_age=max_age)
         if not unchecked and not uploaded:
             logging.info("No new posts need to be made")
             return None
-        uploaded.extend(self.to_imgur(unchecked))
+        try:
+            uploaded.extend(self.to_imgur(unchecked))
+        finally:
+            self.database.flush()
+        uploaded.sort(key=lambda status: status["comic"]["number"])
         if self.only_recent:
             uploaded = uploaded[-1:]
         posts = self.to_reddit(uploaded)